@@ -1,9 +1,188 @@
-# RESUMO DAS MUDANÇAS: Refatorado o código para usar cursores independentes para cada operação de banco de dados, resolvendo o erro "Connection is busy".
+# RESUMO DAS MUDANÇAS: Refatorado o gerenciamento de conexões para usar um pool compartilhado entre sessões, eliminando o handshake ODBC por sessão e o erro "Connection is busy".
 import streamlit as st
 import pandas as pd
 import pyodbc
 import json
-from typing import List, Dict, Any
+import orjson
+import re
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import List
+
+# Habilita o pooling nativo do driver ODBC para que conexões fechadas sejam reaproveitadas.
+pyodbc.pooling = True
+
+# Número de conexões mantidas aquecidas no pool (uma por repositório ativo).
+POOL_SIZE = 4
+
+# --- Pool de Conexões ---
+class ConnectionPool:
+    """
+    Mantém um conjunto de conexões pyodbc prontas para uso, compartilhado por todo o processo.
+    Cada repositório pega uma conexão emprestada pelo tempo de uma query e a devolve em seguida,
+    permitindo que buscas em tabelas diferentes executem em paralelo sem disputar um único cursor.
+    """
+    def __init__(self, connection_string: str, size: int = POOL_SIZE):
+        self._connection_string = connection_string
+        self._connections = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._connections.put(self._new_connection())
+
+    def _new_connection(self):
+        """Abre uma nova conexão com autocommit (a aplicação é somente leitura)."""
+        return pyodbc.connect(self._connection_string, autocommit=True)
+
+    @contextmanager
+    def borrow(self):
+        """
+        Empresta uma conexão do pool dentro de um bloco `with`.
+        Se o pool estiver momentaneamente vazio, abre uma conexão extra em vez de bloquear.
+        Apenas conexões que falharem com erro operacional (conexão caída) são descartadas
+        e substituídas por novas — o que elimina a necessidade de um ping de liveness a
+        cada interação; qualquer outro erro (ex.: SQL inválido, índice full-text ausente)
+        não diz nada sobre a saúde do handle, que volta ao pool normalmente.
+        """
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            # Bifurcação: pool vazio (todas as conexões em uso), abre uma conexão temporária.
+            connection = self._new_connection()
+        try:
+            yield connection
+        except pyodbc.OperationalError:
+            # Bifurcação: a conexão caiu. Descarta o handle ruim e repõe o pool com um novo.
+            try:
+                connection.close()
+            except pyodbc.Error:
+                pass
+            try:
+                self._connections.put_nowait(self._new_connection())
+            except queue.Full:
+                pass
+            raise
+        except BaseException:
+            # Bifurcação: erro que não indica conexão morta; devolve o handle saudável
+            # ao pool antes de propagar, em vez de largá-lo para o garbage collector.
+            self._return_connection(connection)
+            raise
+        else:
+            self._return_connection(connection)
+
+    def _return_connection(self, connection):
+        """Devolve uma conexão ao pool; se a fila já estiver cheia, era extra e é fechada."""
+        try:
+            self._connections.put_nowait(connection)
+        except queue.Full:
+            # Bifurcação: era uma conexão extra além do tamanho do pool; fecha em vez de devolver.
+            connection.close()
+
+    def dedicated(self):
+        """
+        Abre uma conexão dedicada, fora da fila do pool, para repositórios que mantêm
+        cursores de longa duração (reuso de statements preparados entre chamadas).
+        """
+        return self._new_connection()
+
+@st.cache_resource
+def get_pool() -> ConnectionPool:
+    """Cria o pool de conexões uma única vez por processo (compartilhado entre sessões)."""
+    return ConnectionPool(st.secrets["database"]["connection_string"])
+
+# --- Execução de Queries com Cache ---
+
+# Número de linhas trazidas por lote ao materializar resultados.
+FETCH_BATCH_SIZE = 500
+
+def _fetch_dataframe(cursor) -> pd.DataFrame:
+    """
+    Materializa o resultado do cursor em DataFrame lendo em lotes (fetchmany) em vez
+    de um único fetchall. Para os resultados grandes (TOP 1000/5000), isso reduz o
+    pico de objetos Python vivos e sobrepõe a construção do resultado com o envio
+    de linhas pelo servidor.
+    """
+    columns = [column[0] for column in cursor.description]
+    rows = []
+    while True:
+        batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+        # Bifurcação: lote vazio indica fim do result set.
+        if not batch:
+            break
+        rows.extend(batch)
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+def _run_query(sql: str, params: tuple) -> pd.DataFrame:
+    """Executa a query em uma conexão emprestada do pool e materializa o resultado como DataFrame."""
+    with get_pool().borrow() as connection:
+        cursor = connection.cursor()
+        cursor.arraysize = FETCH_BATCH_SIZE
+        try:
+            cursor.execute(sql, params)
+            return _fetch_dataframe(cursor)
+        finally:
+            cursor.close()
+
+@st.cache_data(ttl=60, show_spinner=False, max_entries=256)
+def run_cached_query(sql: str, params: tuple = (), refresh_nonce: int = 0) -> pd.DataFrame:
+    """
+    Versão memoizada de `_run_query`, chaveada pelo texto SQL e pela tupla de parâmetros.
+    Buscas repetidas (mesmo NR_CONTROLE, mesma página de estatísticas) dentro do TTL
+    retornam direto do cache em memória, sem nova ida ao banco.
+
+    `refresh_nonce` também participa da chave: um valor novo força uma ida ao banco
+    apenas para as queries que o receberem (ver "Forçar atualização" na busca), sem
+    invalidar o restante do cache compartilhado.
+    """
+    return _run_query(sql, params)
+
+@st.cache_data(ttl=300, show_spinner=False, max_entries=64)
+def run_cached_stats_query(sql: str, params: tuple = ()) -> pd.DataFrame:
+    """
+    Como `run_cached_query`, mas com TTL mais longo para os agregados por minuto
+    das páginas de estatísticas, que mudam lentamente.
+    """
+    return _run_query(sql, params)
+
+@st.cache_data(ttl=300, show_spinner=False, max_entries=16)
+def run_cached_stats_batch(sql: str, params: tuple = ()) -> List[pd.DataFrame]:
+    """
+    Executa um lote de statements separados por ';' em uma única ida ao banco e
+    devolve um DataFrame por result set, na ordem dos statements. O chamador deve
+    prefixar o lote com 'SET NOCOUNT ON;' para que as mensagens de contagem de
+    linhas não apareçam como result sets intermediários no `nextset()`.
+    """
+    with get_pool().borrow() as connection:
+        cursor = connection.cursor()
+        cursor.arraysize = FETCH_BATCH_SIZE
+        try:
+            cursor.execute(sql, params)
+            frames = []
+            while True:
+                # Bifurcação: statements sem result set (SET, SELECT INTO, DROP) são pulados.
+                if cursor.description is not None:
+                    frames.append(_fetch_dataframe(cursor))
+                if not cursor.nextset():
+                    break
+            return frames
+        finally:
+            cursor.close()
+
+# Colunas leves da TIXLOG retornadas pelas buscas de listagem. Os blobs JSON/JSON_RETORNO
+# dominam o tamanho das linhas e são buscados sob demanda, um registro por vez (get_jsons).
+_TIXLOG_LIGHT_COLS = "[ID], [NR_CONTROLE], [IDREQJDPI], [ORIGEM], [DATAHORA], [USUARIO], [DESCRICAO]"
+
+# Índices cobrindo filtro + ORDER BY ID DESC, para que o TOP (N) pare cedo em um range
+# scan já ordenado em vez de varrer e ordenar (DDL pedido ao DBA):
+#     CREATE INDEX IX_TIXLOG_NRCONTROLE_ID ON TIXLOG(NR_CONTROLE, ID DESC) INCLUDE (IDREQJDPI, ORIGEM, DATAHORA, USUARIO, DESCRICAO);
+#     CREATE INDEX IX_TIXLOG_IDREQJDPI_ID ON TIXLOG(IDREQJDPI, ID DESC) INCLUDE (NR_CONTROLE, ORIGEM, DATAHORA, USUARIO, DESCRICAO);
+#     CREATE INDEX IX_TIXLOG_ORIGEM_ID ON TIXLOG(ORIGEM, ID DESC) INCLUDE (NR_CONTROLE, IDREQJDPI, DATAHORA, USUARIO, DESCRICAO);
+#     CREATE INDEX IX_MIX100_NRCONTROLE_ID ON MIX100(NR_CONTROLE, ID DESC);
+#     CREATE INDEX IX_MIX100_ENDTOENDIDDEV_ID ON MIX100(ENDTOENDIDDEVOLUCAO, ID DESC);
+# As buscas em OUTRAS_INFO usam LIKE '%termo%' (curinga à esquerda), que um índice b-tree
+# não atende; o equivalente no SQL Server é um índice full-text por banco:
+#     CREATE FULLTEXT INDEX ON [indigo_cad].[dbo].[MCLOG] (OUTRAS_INFO) KEY INDEX PK_MCLOG;
+#     CREATE FULLTEXT INDEX ON [indigo_cct].[dbo].[MCLOG] (OUTRAS_INFO) KEY INDEX PK_MCLOG;
 
 # --- Repositório para a tabela TIXLOG ---
 class TixlogRepository:
@@ -11,24 +190,52 @@ class TixlogRepository:
     Gerencia todas as interações com a tabela [indigo_pix].[dbo].[TIXLOG].
     Cada método corresponde a uma operação de busca específica nesta tabela.
     """
-    def __init__(self, connection):
-        # Inicializa o repositório com uma conexão de banco de dados ativa.
-        self._connection = connection
+    def __init__(self, pool: ConnectionPool):
+        # Inicializa o repositório com o pool de conexões compartilhado.
+        self._pool = pool
+        # Conexão dedicada e cursores de longa duração para reuso de statements preparados.
+        self._connection = None
+        self._cursors = {}
 
-    def _format_results(self, cursor) -> List[Dict[str, Any]]:
+    def _format_results(self, cursor) -> pd.DataFrame:
         """
-        Função auxiliar para converter os resultados brutos do banco de dados (lista de tuplas)
-        em um formato mais amigável para Python (lista de dicionários).
+        Função auxiliar para converter os resultados brutos do banco de dados
+        diretamente em um DataFrame, lendo o cursor em lotes.
 
         Returns:
-            List[Dict[str, Any]]: Uma lista de dicionários, onde cada dicionário representa uma linha da tabela.
+            pd.DataFrame: Um DataFrame com uma linha por registro retornado.
+        """
+        return _fetch_dataframe(cursor)
+
+    def _prepared_cursor(self, key: str):
+        """
+        Retorna um cursor de longa duração dedicado a uma query específica.
+        Reexecutar o mesmo texto SQL no mesmo cursor permite ao pyodbc reaproveitar
+        o statement preparado (parse/plano) do servidor entre chamadas.
         """
-        columns = [column[0] for column in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        cursor = self._cursors.get(key)
+        # Bifurcação: cria o cursor (e a conexão dedicada) na primeira chamada.
+        if cursor is None:
+            if self._connection is None:
+                self._connection = self._pool.dedicated()
+            cursor = self._connection.cursor()
+            cursor.arraysize = FETCH_BATCH_SIZE
+            self._cursors[key] = cursor
+        return cursor
 
-    def _execute_query(self, base_query: str, where_clause: str, params: tuple) -> List[Dict[str, Any]]:
+    def _discard_prepared(self):
+        """Descarta a conexão dedicada e os cursores preparados após um erro de conexão."""
+        self._cursors.clear()
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except pyodbc.Error:
+                pass
+            self._connection = None
+
+    def _execute_query(self, base_query: str, where_clause: str, params: tuple, refresh_nonce: int = 0) -> pd.DataFrame:
         """
-        Executa uma consulta SQL de forma segura e padronizada, usando um cursor temporário.
+        Executa uma consulta SQL de forma segura e padronizada, delegando ao executor com cache.
 
         Args:
             base_query (str): A parte principal da query (SELECT ... FROM ...).
@@ -36,209 +243,283 @@ class TixlogRepository:
             params (tuple): Os parâmetros a serem passados de forma segura para a query.
 
         Returns:
-            List[Dict[str, Any]]: O resultado da consulta formatado.
+            pd.DataFrame: O resultado da consulta formatado.
         """
-        cursor = self._connection.cursor()
-        try:
-            sql_query = f"{base_query} WHERE {where_clause} ORDER BY ID DESC"
-            cursor.execute(sql_query, params)
-            return self._format_results(cursor)
-        finally:
-            cursor.close()
+        # OPTION (FAST 1000) inclina o otimizador a um seek que devolve as primeiras
+        # linhas já ordenadas (parando no TOP), em vez de um hash/scan completo.
+        sql_query = f"{base_query} WHERE {where_clause} ORDER BY ID DESC OPTION (FAST 1000)"
+        return run_cached_query(sql_query, params, refresh_nonce)
 
-    def find_by_nr_controle(self, nr_controle: str) -> List[Dict[str, Any]]:
+    def find_by_nr_controle(self, nr_controle: str, refresh_nonce: int = 0) -> pd.DataFrame:
         """Busca registros por um NR_CONTROLE específico."""
-        if not nr_controle: return [] # Bifurcação: evita busca desnecessária se o input for vazio.
-        query = "SELECT TOP (1000) * FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)"
-        return self._execute_query(query, "NR_CONTROLE = ?", (nr_controle,))
+        if not nr_controle: return pd.DataFrame() # Bifurcação: evita busca desnecessária se o input for vazio.
+        query = f"SELECT TOP (1000) {_TIXLOG_LIGHT_COLS} FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)"
+        return self._execute_query(query, "NR_CONTROLE = ?", (nr_controle,), refresh_nonce)
 
-    def find_by_idreqjdpi(self, idreqjdpi: str) -> List[Dict[str, Any]]:
+    def find_by_idreqjdpi(self, idreqjdpi: str, refresh_nonce: int = 0) -> pd.DataFrame:
         """Busca registros por um IDREQJDPI específico."""
-        if not idreqjdpi: return [] # Bifurcação: evita busca desnecessária se o input for vazio.
-        query = "SELECT TOP (1000) * FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)"
-        return self._execute_query(query, "IDREQJDPI = ?", (idreqjdpi,))
-
-    def find_by_nr_controle_in(self, nr_controles: List[str]) -> List[Dict[str, Any]]:
-        """Busca registros que correspondam a uma lista de NR_CONTROLE."""
-        if not nr_controles: return [] # Bifurcação: retorna lista vazia se não houver itens para buscar.
-        query = "SELECT TOP (1000) * FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)"
-        placeholders = ', '.join(['?' for _ in nr_controles])
-        where_clause = f"NR_CONTROLE IN ({placeholders})"
-        return self._execute_query(query, where_clause, tuple(nr_controles))
-
-    def find_by_json_content(self, text_to_find: str) -> List[Dict[str, Any]]:
-        """Busca um texto dentro das colunas JSON e JSON_RETORNO."""
-        if not text_to_find: return [] # Bifurcação: evita busca desnecessária se o input for vazio.
-        cursor = self._connection.cursor()
-        try:
-            param_value = f"%{text_to_find}%"
-            sql_query = """
-                SELECT TOP (1000) 
-                    *,
+        if not idreqjdpi: return pd.DataFrame() # Bifurcação: evita busca desnecessária se o input for vazio.
+        query = f"SELECT TOP (1000) {_TIXLOG_LIGHT_COLS} FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)"
+        return self._execute_query(query, "IDREQJDPI = ?", (idreqjdpi,), refresh_nonce)
+
+    def find_by_nr_controle_in(self, nr_controles: List[str], refresh_nonce: int = 0) -> pd.DataFrame:
+        """
+        Busca registros que correspondam a uma lista de NR_CONTROLE.
+
+        A lista inteira é passada como um único parâmetro e aberta no servidor com
+        STRING_SPLIT (SQL Server 2016+): o texto SQL (e portanto o plano cacheado)
+        é o mesmo para qualquer tamanho de lista, ao contrário do IN (?, ?, ...)
+        antigo, que gerava um plano novo para cada N e inflava o plan cache.
+        Linhas repetidas no text_area são deduplicadas antes do join (o JOIN produz
+        uma linha de saída por valor casado, o que o IN antigo nunca fazia), e o
+        DISTINCT cobre qualquer duplicidade restante.
+        """
+        if not nr_controles: return pd.DataFrame() # Bifurcação: retorna resultado vazio se não houver itens para buscar.
+        light_cols = ', '.join(f"t.{column}" for column in _TIXLOG_LIGHT_COLS.split(', '))
+        sql_query = f"""
+            SELECT DISTINCT TOP (1000) {light_cols}
+            FROM [indigo_pix].[dbo].[TIXLOG] t WITH (NOLOCK)
+            JOIN STRING_SPLIT(?, ',') s ON t.NR_CONTROLE = s.value
+            ORDER BY t.ID DESC
+            OPTION (FAST 1000)
+        """
+        # Os NR_CONTROLE vêm de um text_area separado por linhas e não contêm vírgulas;
+        # dict.fromkeys remove repetições preservando a ordem digitada.
+        return run_cached_query(sql_query, (','.join(dict.fromkeys(nr_controles)),), refresh_nonce)
+
+    def find_by_json_content(self, text_to_find: str, refresh_nonce: int = 0) -> pd.DataFrame:
+        """
+        Busca um texto dentro das colunas JSON e JSON_RETORNO.
+
+        Termos simples tentam o índice full-text das duas colunas (CONTAINS), que faz uma
+        consulta por índice invertido em vez de varrer todos os blobs NVARCHAR(MAX).
+        Depende do índice criado pelo DBA:
+            CREATE FULLTEXT INDEX ON [indigo_pix].[dbo].[TIXLOG] ([JSON], [JSON_RETORNO]) KEY INDEX PK_TIXLOG;
+        Enquanto o índice não existir, o CONTAINS falha (erro 7601) e a busca degrada
+        automaticamente para a varredura LIKE original. Termos com pontuação/chaves de
+        JSON (que o parser full-text quebraria) vão direto para o LIKE.
+
+        Atenção: no full-text do SQL Server o '*' inicial de "*termo*" é ignorado — o
+        caminho CONTAINS casa por prefixo de token, então fragmentos no meio de um
+        token (ex.: o miolo de um ID) que o LIKE '%termo%' encontraria podem não
+        aparecer; nesse caso, use um termo com pontuação para forçar o caminho LIKE.
+        """
+        if not text_to_find: return pd.DataFrame() # Bifurcação: evita busca desnecessária se o input for vazio.
+        param_value = f"%{text_to_find}%"
+        like_query = f"""
+            SELECT TOP (1000)
+                {_TIXLOG_LIGHT_COLS},
+                CASE
+                    WHEN [JSON] LIKE ? AND [JSON_RETORNO] LIKE ? THEN 'Ambos'
+                    WHEN [JSON] LIKE ? THEN 'JSON Enviado'
+                    WHEN [JSON_RETORNO] LIKE ? THEN 'JSON Retorno'
+                END AS LocalEncontrado
+            FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)
+            WHERE ([JSON] LIKE ? OR [JSON_RETORNO] LIKE ?)
+            ORDER BY ID DESC
+            OPTION (FAST 1000)
+        """
+        like_params = (param_value,) * 6
+        # Bifurcação: só tenta CONTAINS para termos que o tokenizador full-text trata como uma palavra.
+        if re.fullmatch(r'\w+', text_to_find):
+            # O CONTAINS filtra via índice invertido; o CASE com LIKE roda apenas sobre
+            # as (no máximo) 1000 linhas já filtradas, só para rotular onde o termo apareceu.
+            contains_term = f'"*{text_to_find}*"'
+            contains_query = f"""
+                SELECT TOP (1000)
+                    {_TIXLOG_LIGHT_COLS},
                     CASE
                         WHEN [JSON] LIKE ? AND [JSON_RETORNO] LIKE ? THEN 'Ambos'
                         WHEN [JSON] LIKE ? THEN 'JSON Enviado'
                         WHEN [JSON_RETORNO] LIKE ? THEN 'JSON Retorno'
                     END AS LocalEncontrado
                 FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)
-                WHERE ([JSON] LIKE ? OR [JSON_RETORNO] LIKE ?)
+                WHERE CONTAINS(([JSON], [JSON_RETORNO]), ?)
                 ORDER BY ID DESC
+                OPTION (FAST 1000)
             """
-            params = (param_value, param_value, param_value, param_value, param_value, param_value)
-            cursor.execute(sql_query, params)
-            return self._format_results(cursor)
-        except pyodbc.Error as ex:
-            st.error(f"Erro ao executar a busca no JSON: {ex}")
-            return []
-        finally:
-            cursor.close()
+            try:
+                return run_cached_query(contains_query, (param_value,) * 4 + (contains_term,), refresh_nonce)
+            except pyodbc.ProgrammingError:
+                # Bifurcação: tabela ainda sem índice full-text (erro 7601 do SQL Server);
+                # cai para a varredura LIKE em vez de quebrar a busca mais comum.
+                pass
+        return run_cached_query(like_query, like_params, refresh_nonce)
 
-    def find_by_origem(self, origem: str) -> List[Dict[str, Any]]:
+    def find_by_origem(self, origem: str, refresh_nonce: int = 0) -> pd.DataFrame:
         """Busca registros por uma ORIGEM específica."""
-        if not origem: return [] # Bifurcação: evita busca desnecessária se o input for vazio.
-        query = "SELECT TOP (1000) * FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)"
-        return self._execute_query(query, "ORIGEM = ?", (origem,))
-        
-    def get_new_entries_per_minute(self) -> List[Dict[str, Any]]:
+        if not origem: return pd.DataFrame() # Bifurcação: evita busca desnecessária se o input for vazio.
+        query = f"SELECT TOP (1000) {_TIXLOG_LIGHT_COLS} FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)"
+        return self._execute_query(query, "ORIGEM = ?", (origem,), refresh_nonce)
+
+    def get_jsons(self, id_: int) -> tuple:
+        """
+        Busca os payloads JSON/JSON_RETORNO de um único registro, sob demanda.
+        As buscas de listagem não trazem mais esses blobs (ver _TIXLOG_LIGHT_COLS);
+        eles só são transferidos quando o usuário pede para ver o detalhe.
+
+        Returns:
+            tuple: (JSON, JSON_RETORNO), ou (None, None) se o registro não existir.
+        """
+        sql_query = "SELECT [JSON], [JSON_RETORNO] FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK) WHERE ID = ?"
+        result = run_cached_query(sql_query, (int(id_),))
+        # Bifurcação: registro pode ter sido expurgado entre a listagem e o clique.
+        if result.empty:
+            return (None, None)
+        # .iat acessa o escalar direto, sem construir a Series intermediária do .iloc[0].
+        return (result['JSON'].iat[0], result['JSON_RETORNO'].iat[0])
+
+    def get_new_entries_per_minute(self) -> pd.DataFrame:
         """
         Calcula o número de novos NR_CONTROLE por minuto nas últimas 24 horas para a seção de estatísticas.
         """
-        cursor = self._connection.cursor()
-        try:
-            sql_query = """
-                WITH PrimeirasOcorrencias AS (
-                    SELECT
-                        [DATAHORA],
-                        [NR_CONTROLE],
-                        ROW_NUMBER() OVER(PARTITION BY [NR_CONTROLE] ORDER BY [DATAHORA] ASC) AS OrdemAparicao
-                    FROM
-                        [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)
-                    WHERE [DATAHORA] >= DATEADD(day, -1, GETDATE())
-                )
+        # Pedido ao DBA (rollup pré-agregado): uma tabela TIXLOG_POR_MINUTO alimentada por
+        # um job do SQL Agent a cada minuto (SQL Server não aceita COUNT DISTINCT em views
+        # indexadas) deixaria esta query lendo ~1440 linhas em vez de varrer o dia inteiro:
+        #     CREATE TABLE dbo.TIXLOG_POR_MINUTO (Minuto char(16) PRIMARY KEY, NovosNrControle int);
+        # Quando existir, basta trocar o FROM abaixo pelo rollup.
+        # A primeira ocorrência de cada NR_CONTROLE é obtida com MIN(DATAHORA)/GROUP BY,
+        # um agregado simples, em vez de ROW_NUMBER(), que materializa e ordena todas as
+        # linhas de cada partição só para descartar tudo menos a primeira.
+        # O filtro por DATAHORA se beneficia do índice (pedido ao DBA):
+        #     CREATE INDEX IX_TIXLOG_DATAHORA_NRCTRL ON TIXLOG(DATAHORA) INCLUDE(NR_CONTROLE);
+        # O bucket por minuto usa CONVERT estilo 120 ('yyyy-MM-dd HH:mm'), bem mais barato
+        # por linha que a função CLR FORMAT.
+        sql_query = """
+            WITH PrimeirasOcorrencias AS (
                 SELECT
-                    FORMAT([DATAHORA], 'yyyy-MM-dd HH:mm') AS [MinutoFormatado],
-                    COUNT(*) AS [NovosNrControlePorMinuto]
+                    [NR_CONTROLE],
+                    MIN([DATAHORA]) AS [PrimeiraOcorrencia]
                 FROM
-                    PrimeirasOcorrencias
-                WHERE
-                    OrdemAparicao = 1
+                    [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)
+                WHERE [DATAHORA] >= DATEADD(day, -1, GETDATE())
                 GROUP BY
-                    FORMAT([DATAHORA], 'yyyy-MM-dd HH:mm')
-                ORDER BY
-                    [MinutoFormatado] ASC;
-            """
-            cursor.execute(sql_query)
-            return self._format_results(cursor)
+                    [NR_CONTROLE]
+            )
+            SELECT
+                CONVERT(char(16), [PrimeiraOcorrencia], 120) AS [MinutoFormatado],
+                COUNT(*) AS [NovosNrControlePorMinuto]
+            FROM
+                PrimeirasOcorrencias
+            GROUP BY
+                CONVERT(char(16), [PrimeiraOcorrencia], 120)
+            ORDER BY
+                [MinutoFormatado] ASC;
+        """
+        try:
+            result = run_cached_stats_query(sql_query)
+            # Bifurcação: sem linhas, não há o que converter ou indexar.
+            if result.empty:
+                return result
+            # Contadores por minuto cabem folgados em int32; metade da banda de memória.
+            result = result.astype({'NovosNrControlePorMinuto': 'int32'}, errors='ignore')
+            # O formato é conhecido (CONVERT estilo 120), então o parse é vetorizado sem
+            # inferência por linha; o índice datetime já sai pronto para o line_chart.
+            result['MinutoFormatado'] = pd.to_datetime(result['MinutoFormatado'], format='%Y-%m-%d %H:%M')
+            return result.set_index('MinutoFormatado')
         except pyodbc.Error as ex:
             st.error(f"Erro ao buscar estatísticas: {ex}")
-            return []
-        finally:
-            cursor.close()
+            return pd.DataFrame()
 
-    def get_transaction_summary(self, nr_controle: str) -> List[Dict[str, Any]]:
+    def get_transaction_summary(self, nr_controle: str) -> pd.DataFrame:
         """
         Calcula o tempo total e a quantidade de etapas para um único NR_CONTROLE.
         """
-        if not nr_controle: return []
-        cursor = self._connection.cursor()
+        if not nr_controle: return pd.DataFrame()
+        # Tipo de operação e agregados de tempo/etapas são calculados em uma única
+        # passada pela tabela; as duas CTEs antigas varriam as mesmas linhas duas vezes.
+        sql_query = """
+            SELECT
+                NR_CONTROLE,
+                ISNULL(MAX(
+                    CASE
+                        WHEN USUARIO = 'envia_pix_prod' OR DESCRICAO LIKE '%DÉBITO%' THEN 'OUT'
+                        WHEN USUARIO = 'recebe_pix_prod' OR DESCRICAO LIKE '%CRÉDITO%' THEN 'IN'
+                        ELSE 'Indefinido'
+                    END
+                ), 'Indefinido') AS Tipo_Operacao,
+                MIN(DATAHORA) AS Primeira_Operacao,
+                MAX(DATAHORA) AS Ultima_Operacao,
+                DATEDIFF(MILLISECOND, MIN(DATAHORA), MAX(DATAHORA)) AS Intervalo_Total_MS,
+                COUNT(ID) AS Quantidade_Etapas
+            FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)
+            WHERE NR_CONTROLE = ?
+            GROUP BY NR_CONTROLE;
+        """
         try:
-            sql_query = """
-                WITH OperationType_CTE AS (
-                    SELECT
-                        NR_CONTROLE,
-                        MAX(
-                            CASE
-                                WHEN USUARIO = 'envia_pix_prod' OR DESCRICAO LIKE '%DÉBITO%' THEN 'OUT'
-                                WHEN USUARIO = 'recebe_pix_prod' OR DESCRICAO LIKE '%CRÉDITO%' THEN 'IN'
-                                ELSE 'Indefinido'
-                            END
-                        ) AS Tipo_Operacao
-                    FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)
-                    WHERE NR_CONTROLE = ?
-                    GROUP BY NR_CONTROLE
-                ),
-                TransactionAggregation_CTE AS (
-                    SELECT
-                        NR_CONTROLE,
-                        MIN(DATAHORA) AS Primeira_Operacao,
-                        MAX(DATAHORA) AS Ultima_Operacao,
-                        DATEDIFF(MILLISECOND, MIN(DATAHORA), MAX(DATAHORA)) AS Intervalo_Total_MS,
-                        COUNT(ID) AS Quantidade_Etapas
-                    FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK)
-                    WHERE NR_CONTROLE = ?
-                    GROUP BY NR_CONTROLE
-                )
-                SELECT
-                    agg.NR_CONTROLE,
-                    ISNULL(ot.Tipo_Operacao, 'Indefinido') AS Tipo_Operacao,
-                    agg.Primeira_Operacao,
-                    agg.Ultima_Operacao,
-                    agg.Intervalo_Total_MS,
-                    agg.Quantidade_Etapas
-                FROM TransactionAggregation_CTE agg
-                LEFT JOIN OperationType_CTE ot ON agg.NR_CONTROLE = ot.NR_CONTROLE;
-            """
-            cursor.execute(sql_query, (nr_controle, nr_controle))
+            # O mesmo texto SQL no mesmo cursor reaproveita o statement preparado no servidor.
+            cursor = self._prepared_cursor('transaction_summary')
+            cursor.execute(sql_query, (nr_controle,))
             return self._format_results(cursor)
+        except pyodbc.OperationalError as ex:
+            # Bifurcação: a conexão dedicada caiu; descarta para reconectar na próxima chamada.
+            self._discard_prepared()
+            st.error(f"Erro ao buscar o sumário da transação: {ex}")
+            return pd.DataFrame()
         except pyodbc.Error as ex:
             st.error(f"Erro ao buscar o sumário da transação: {ex}")
-            return []
-        finally:
-            cursor.close()
+            return pd.DataFrame()
+
+    # Agregado de performance: uma única passada calcula tipo de operação e intervalo por NR_CONTROLE.
+    _PERF_SUMMARY_SELECT = """
+        SELECT
+            NR_CONTROLE,
+            ISNULL(MAX(
+                CASE
+                    WHEN USUARIO = 'envia_pix_prod' OR DESCRICAO LIKE '%DÉBITO%' THEN 'OUT'
+                    WHEN USUARIO = 'recebe_pix_prod' OR DESCRICAO LIKE '%CRÉDITO%' THEN 'IN'
+                    ELSE 'Indefinido'
+                END
+            ), 'Indefinido') AS Tipo_Operacao,
+            DATEDIFF(MILLISECOND, MIN(DATAHORA), MAX(DATAHORA)) AS Intervalo_Total_MS
+        FROM {source}
+        GROUP BY NR_CONTROLE
+    """
+
+    @staticmethod
+    def _downcast_perf(result: pd.DataFrame) -> pd.DataFrame:
+        """
+        Downcast na ingestão dos dados de performance: intervalos em float32 e o tipo
+        de operação (3 valores possíveis) como categórica. Metade da banda de memória
+        nas reduções e caminho rápido do groupby com observed=True.
+        """
+        return result.astype({'Intervalo_Total_MS': 'float32', 'Tipo_Operacao': 'category'}, errors='ignore')
 
-    def get_performance_summary_data(self, mode: str) -> List[Dict[str, Any]]:
+    def get_performance_summary_data(self, mode: str) -> pd.DataFrame:
         """
         Busca dados agregados de transações para análise de performance.
-        
+
         Args:
             mode (str): O modo de busca ('24h' ou '100k').
         """
-        # Define a subquery de origem dos dados com base no modo
-        source_data_subquery = ""
         if mode == '24h':
-            source_data_subquery = "[indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK) WHERE [DATAHORA] >= DATEADD(day, -1, GETDATE())"
+            sql_query = self._PERF_SUMMARY_SELECT.format(
+                source="[indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK) WHERE [DATAHORA] >= DATEADD(day, -1, GETDATE())"
+            ) + ";"
+            try:
+                return self._downcast_perf(run_cached_query(sql_query))
+            except pyodbc.Error as ex:
+                st.error(f"Erro ao buscar dados de performance: {ex}")
+                return pd.DataFrame()
         elif mode == '100k':
-            source_data_subquery = "(SELECT TOP 100000 * FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK) ORDER BY ID DESC) AS RecentLogs"
+            # As 100k linhas mais recentes são materializadas uma única vez em uma temp table
+            # (#R, descartada no fim do lote), com apenas as colunas que o agregado usa —
+            # o sort TOP 100000 não arrasta os blobs JSON e roda uma vez, não a cada leitura.
+            sql_batch = (
+                "SET NOCOUNT ON;"
+                "SELECT TOP 100000 NR_CONTROLE, USUARIO, DESCRICAO, DATAHORA"
+                " INTO #R FROM [indigo_pix].[dbo].[TIXLOG] WITH (NOLOCK) ORDER BY ID DESC;"
+                + self._PERF_SUMMARY_SELECT.format(source="#R") + ";"
+                "DROP TABLE #R;"
+            )
+            try:
+                frames = run_cached_stats_batch(sql_batch)
+                return self._downcast_perf(frames[0]) if frames else pd.DataFrame()
+            except pyodbc.Error as ex:
+                st.error(f"Erro ao buscar dados de performance: {ex}")
+                return pd.DataFrame()
         else:
-            return []
-
-        cursor = self._connection.cursor()
-        try:
-            sql_query = f"""
-                WITH OperationType_CTE AS (
-                    SELECT
-                        NR_CONTROLE,
-                        MAX(
-                            CASE
-                                WHEN USUARIO = 'envia_pix_prod' OR DESCRICAO LIKE '%DÉBITO%' THEN 'OUT'
-                                WHEN USUARIO = 'recebe_pix_prod' OR DESCRICAO LIKE '%CRÉDITO%' THEN 'IN'
-                                ELSE 'Indefinido'
-                            END
-                        ) AS Tipo_Operacao
-                    FROM {source_data_subquery}
-                    GROUP BY NR_CONTROLE
-                ),
-                TransactionAggregation_CTE AS (
-                    SELECT
-                        NR_CONTROLE,
-                        DATEDIFF(MILLISECOND, MIN(DATAHORA), MAX(DATAHORA)) AS Intervalo_Total_MS
-                    FROM {source_data_subquery}
-                    GROUP BY NR_CONTROLE
-                )
-                SELECT
-                    agg.NR_CONTROLE,
-                    ISNULL(ot.Tipo_Operacao, 'Indefinido') AS Tipo_Operacao,
-                    agg.Intervalo_Total_MS
-                FROM TransactionAggregation_CTE agg
-                LEFT JOIN OperationType_CTE ot ON agg.NR_CONTROLE = ot.NR_CONTROLE;
-            """
-            cursor.execute(sql_query)
-            return self._format_results(cursor)
-        except pyodbc.Error as ex:
-            st.error(f"Erro ao buscar dados de performance: {ex}")
-            return []
-        finally:
-            cursor.close()
+            return pd.DataFrame()
 
 # --- Repositório para a tabela MCLOG (CAD) ---
 class MclogRepository:
@@ -246,86 +527,119 @@ class MclogRepository:
     Gerencia todas as interações com a tabela [indigo_cad].[dbo].[MCLOG].
     Focada na busca de informações gerais e estatísticas de operações.
     """
-    def __init__(self, connection):
-        # Inicializa o repositório com uma conexão de banco de dados ativa.
-        self._connection = connection
+    def __init__(self, pool: ConnectionPool):
+        # Inicializa o repositório com o pool de conexões compartilhado.
+        self._pool = pool
 
-    def _format_results(self, cursor) -> List[Dict[str, Any]]:
-        """Função auxiliar para formatar resultados do banco de dados."""
-        columns = [column[0] for column in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
-
-    def find_by_outras_info(self, search_term: str) -> List[Dict[str, Any]]:
+    def find_by_outras_info(self, search_term: str, refresh_nonce: int = 0) -> pd.DataFrame:
         """Busca um termo genérico na coluna OUTRAS_INFO."""
-        if not search_term: return [] # Bifurcação: evita busca desnecessária se o input for vazio.
-        cursor = self._connection.cursor()
-        try:
-            param_value = f"%{search_term}%"
-            sql_query = "SELECT TOP (1000) * FROM [indigo_cad].[dbo].[MCLOG] WITH (NOLOCK) WHERE OUTRAS_INFO LIKE ? ORDER BY ID DESC"
-            cursor.execute(sql_query, (param_value,))
-            return self._format_results(cursor)
-        except pyodbc.Error as ex:
-            st.error(f"Erro ao executar a busca em MCLOG: {ex}")
-            return []
-        finally:
-            cursor.close()
+        if not search_term: return pd.DataFrame() # Bifurcação: evita busca desnecessária se o input for vazio.
+        param_value = f"%{search_term}%"
+        sql_query = "SELECT TOP (1000) * FROM [indigo_cad].[dbo].[MCLOG] WITH (NOLOCK) WHERE OUTRAS_INFO LIKE ? ORDER BY ID DESC OPTION (FAST 1000)"
+        return run_cached_query(sql_query, (param_value,), refresh_nonce)
 
-    def get_operations_per_minute(self, hours_ago: int = 24) -> List[Dict[str, Any]]:
+    def find_by_outras_info_in(self, search_terms: List[str], refresh_nonce: int = 0) -> pd.DataFrame:
         """
-        Calcula o número de operações por função e por minuto na tabela MCLOG em um período customizável.
-        
-        Args:
-            hours_ago (int): O número de horas para olhar para trás a partir do momento atual.
+        Busca vários termos na coluna OUTRAS_INFO em uma única query.
+        Substitui o padrão N+1 de uma chamada `find_by_outras_info` por item:
+        a lista inteira vai ao servidor de uma vez via STRING_SPLIT e o fan-out
+        acontece do lado do banco, em um único round trip. O DISTINCT absorve
+        linhas que casem com mais de um termo, dispensando dedupe no cliente.
+        """
+        if not search_terms: return pd.DataFrame() # Bifurcação: evita busca desnecessária se a lista for vazia.
+        sql_query = """
+            SELECT DISTINCT TOP (1000) m.*
+            FROM [indigo_cad].[dbo].[MCLOG] m WITH (NOLOCK)
+            JOIN STRING_SPLIT(?, ',') s ON m.OUTRAS_INFO LIKE '%' + s.value + '%'
+            ORDER BY m.ID DESC
+            OPTION (FAST 1000)
+        """
+        # Os termos vêm de um text_area separado por linhas e não contêm vírgulas.
+        return run_cached_query(sql_query, (','.join(search_terms),), refresh_nonce)
+
+    # Statements das estatísticas da MCLOG, enviados juntos em um único round trip.
+    # Pedido ao DBA (rollup pré-agregado): view indexada materializando o agregado por
+    # minuto/função, para que o gráfico leia o rollup em vez de varrer a MCLOG crua:
+    #     CREATE VIEW dbo.vw_MCLOG_POR_MINUTO WITH SCHEMABINDING AS
+    #         SELECT CONVERT(char(16), DATAHORA, 120) AS Minuto, FUNCAO,
+    #                COUNT_BIG(*) AS NumeroDeOperacoes
+    #         FROM dbo.MCLOG GROUP BY CONVERT(char(16), DATAHORA, 120), FUNCAO;
+    #     CREATE UNIQUE CLUSTERED INDEX IX_vw_MCLOG_POR_MINUTO ON dbo.vw_MCLOG_POR_MINUTO (Minuto, FUNCAO);
+    _OPS_PER_MINUTE_SQL = """
+        SELECT
+            CONVERT(char(16), DATAHORA, 120) AS Minuto,
+            FUNCAO,
+            COUNT(*) AS NumeroDeOperacoes
+        FROM
+            [indigo_cad].[dbo].MCLOG WITH (NOLOCK)
+        WHERE DATAHORA >= DATEADD(hour, -?, GETDATE())
+        GROUP BY
+            CONVERT(char(16), DATAHORA, 120),
+            FUNCAO
+        ORDER BY
+            Minuto ASC,
+            FUNCAO
+    """
+
+    _LATEST_ERRORS_SQL = """
+        SELECT TOP (1000)
+            [ID], [USUARIO], [DATAHORA], [FUNCAO], [IAE], [OUTRAS_INFO], [CODIGO_CLIENTE]
+        FROM
+            [indigo_cad].[dbo].MCLOG WITH (NOLOCK)
+        WHERE
+            IAE = 'E' AND DATAHORA >= DATEADD(day, -1, GETDATE())
+        ORDER BY
+            ID DESC
+    """
+
+    def list_functions(self) -> List[str]:
+        """
+        Lista as funções distintas vistas na MCLOG nas últimas 24 horas, em ordem
+        alfabética. Consulta minúscula e separada, usada para popular o filtro do
+        gráfico sem depender do resultado (bem maior) das operações por minuto.
+        """
+        sql_query = """
+            SELECT DISTINCT FUNCAO
+            FROM [indigo_cad].[dbo].MCLOG WITH (NOLOCK)
+            WHERE DATAHORA >= DATEADD(day, -1, GETDATE())
+            ORDER BY FUNCAO;
         """
-        cursor = self._connection.cursor()
         try:
-            sql_query = """
-                SELECT
-                    FORMAT(DATAHORA, 'yyyy-MM-dd HH:mm') AS Minuto,
-                    FUNCAO,
-                    COUNT(*) AS NumeroDeOperacoes
-                FROM
-                    [indigo_cad].[dbo].MCLOG WITH (NOLOCK)
-                WHERE DATAHORA >= DATEADD(hour, -?, GETDATE())
-                GROUP BY
-                    FORMAT(DATAHORA, 'yyyy-MM-dd HH:mm'),
-                    FUNCAO
-                ORDER BY
-                    Minuto ASC,
-                    FUNCAO;
-            """
-            cursor.execute(sql_query, (hours_ago,))
-            return self._format_results(cursor)
+            result = run_cached_stats_query(sql_query)
+            # Bifurcação: nenhuma operação no período deixa o filtro vazio.
+            if result.empty:
+                return []
+            return result['FUNCAO'].tolist()
         except pyodbc.Error as ex:
-            st.error(f"Erro ao buscar estatísticas da MCLOG: {ex}")
+            st.error(f"Erro ao listar funções da MCLOG: {ex}")
             return []
-        finally:
-            cursor.close()
 
-    def get_latest_errors(self) -> List[Dict[str, Any]]:
+    def get_stats_bundle(self, hours_ago: int = 24) -> tuple:
         """
-        Busca os últimos 1000 erros (IAE = 'E') da MCLOG nas últimas 24 horas.
+        Busca as operações por função/minuto e os últimos 1000 erros (IAE = 'E')
+        em uma única ida ao banco. Os dois SELECTs são enviados como um lote
+        separado por ';' e os result sets lidos em sequência com `nextset()`,
+        economizando um round trip por clique em "Gerar Gráfico de Operações".
+        O CONVERT estilo 120 produz o mesmo 'yyyy-MM-dd HH:mm' que o FORMAT
+        antigo, mas sem o custo por linha da função CLR FORMAT (~10x mais lenta).
+
+        Args:
+            hours_ago (int): O número de horas para olhar para trás no gráfico de operações.
+
+        Returns:
+            tuple: (operações por minuto, últimos erros), como DataFrames.
         """
-        cursor = self._connection.cursor()
+        # SET NOCOUNT ON evita que as contagens de linhas virem result sets no nextset().
+        sql_batch = "SET NOCOUNT ON;" + self._OPS_PER_MINUTE_SQL + ";" + self._LATEST_ERRORS_SQL + ";"
         try:
-            # A query já seleciona apenas as colunas desejadas para otimização.
-            sql_query = """
-                SELECT TOP (1000)
-                    [ID], [USUARIO], [DATAHORA], [FUNCAO], [IAE], [OUTRAS_INFO], [CODIGO_CLIENTE]
-                FROM
-                    [indigo_cad].[dbo].MCLOG WITH (NOLOCK)
-                WHERE
-                    IAE = 'E' AND DATAHORA >= DATEADD(day, -1, GETDATE())
-                ORDER BY
-                    ID DESC;
-            """
-            cursor.execute(sql_query)
-            return self._format_results(cursor)
+            ops, errors = run_cached_stats_batch(sql_batch, (hours_ago,))
+            # Downcast na ingestão: contadores em int32 e FUNCAO como categórica (os
+            # mesmos poucos nomes se repetem a cada minuto), acelerando groupby/pivot.
+            ops = ops.astype({'NumeroDeOperacoes': 'int32', 'FUNCAO': 'category'}, errors='ignore')
+            return ops, errors
         except pyodbc.Error as ex:
-            st.error(f"Erro ao buscar os últimos erros da MCLOG: {ex}")
-            return []
-        finally:
-            cursor.close()
+            st.error(f"Erro ao buscar estatísticas da MCLOG: {ex}")
+            return pd.DataFrame(), pd.DataFrame()
 
 # --- Repositório para a tabela MIX100 ---
 class Mix100Repository:
@@ -333,42 +647,21 @@ class Mix100Repository:
     Gerencia todas as interações com a tabela [indigo_pix].[dbo].[MIX100].
     Focada em buscas relacionadas a transações PIX.
     """
-    def __init__(self, connection):
-        # Inicializa o repositório com uma conexão de banco de dados ativa.
-        self._connection = connection
-
-    def _format_results(self, cursor) -> List[Dict[str, Any]]:
-        """Função auxiliar para formatar resultados do banco de dados."""
-        columns = [column[0] for column in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    def __init__(self, pool: ConnectionPool):
+        # Inicializa o repositório com o pool de conexões compartilhado.
+        self._pool = pool
 
-    def find_by_nr_controle(self, nr_controle: str) -> List[Dict[str, Any]]:
+    def find_by_nr_controle(self, nr_controle: str, refresh_nonce: int = 0) -> pd.DataFrame:
         """Busca transações por um NR_CONTROLE específico."""
-        if not nr_controle: return [] # Bifurcação: evita busca desnecessária se o input for vazio.
-        cursor = self._connection.cursor()
-        try:
-            sql_query = "SELECT TOP (500) * FROM [indigo_pix].[dbo].[MIX100] WITH (NOLOCK) WHERE NR_CONTROLE = ? ORDER BY id DESC"
-            cursor.execute(sql_query, (nr_controle,))
-            return self._format_results(cursor)
-        except pyodbc.Error as ex:
-            st.error(f"Erro ao executar a busca em MIX100: {ex}")
-            return []
-        finally:
-            cursor.close()
+        if not nr_controle: return pd.DataFrame() # Bifurcação: evita busca desnecessária se o input for vazio.
+        sql_query = "SELECT TOP (500) * FROM [indigo_pix].[dbo].[MIX100] WITH (NOLOCK) WHERE NR_CONTROLE = ? ORDER BY id DESC OPTION (FAST 500)"
+        return run_cached_query(sql_query, (nr_controle,), refresh_nonce)
             
-    def find_by_endtoendiddevolucao(self, endtoendid: str) -> List[Dict[str, Any]]:
+    def find_by_endtoendiddevolucao(self, endtoendid: str, refresh_nonce: int = 0) -> pd.DataFrame:
         """Busca transações de devolução por seu EndToEndId específico."""
-        if not endtoendid: return [] # Bifurcação: evita busca desnecessária se o input for vazio.
-        cursor = self._connection.cursor()
-        try:
-            sql_query = "SELECT TOP (500) * FROM [indigo_pix].[dbo].[MIX100] WITH (NOLOCK) WHERE ENDTOENDIDDEVOLUCAO = ? ORDER BY id DESC"
-            cursor.execute(sql_query, (endtoendid,))
-            return self._format_results(cursor)
-        except pyodbc.Error as ex:
-            st.error(f"Erro ao executar a busca por EndToEndId Devolução: {ex}")
-            return []
-        finally:
-            cursor.close()
+        if not endtoendid: return pd.DataFrame() # Bifurcação: evita busca desnecessária se o input for vazio.
+        sql_query = "SELECT TOP (500) * FROM [indigo_pix].[dbo].[MIX100] WITH (NOLOCK) WHERE ENDTOENDIDDEVOLUCAO = ? ORDER BY id DESC OPTION (FAST 500)"
+        return run_cached_query(sql_query, (endtoendid,), refresh_nonce)
 
 # --- Repositório para a tabela MCLOG (CCT) ---
 class MclogCctRepository:
@@ -376,79 +669,141 @@ class MclogCctRepository:
     Gerencia interações com a tabela [indigo_cct].[dbo].[MCLOG].
     Focada em buscas relacionadas a logs de transações KYT.
     """
-    def __init__(self, connection):
-        # Inicializa o repositório com uma conexão de banco de dados ativa.
-        self._connection = connection
+    def __init__(self, pool: ConnectionPool):
+        # Inicializa o repositório com o pool de conexões compartilhado.
+        self._pool = pool
 
-    def _format_results(self, cursor) -> List[Dict[str, Any]]:
-        """Função auxiliar para formatar resultados do banco de dados."""
-        columns = [column[0] for column in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
-
-    def find_by_kyt_id(self, kyt_id: str) -> List[Dict[str, Any]]:
+    def find_by_kyt_id(self, kyt_id: str, refresh_nonce: int = 0) -> pd.DataFrame:
         """Busca logs por um ID de transação KYT na coluna OUTRAS_INFO."""
-        if not kyt_id: return [] # Bifurcação: evita busca desnecessária se o input for vazio.
-        cursor = self._connection.cursor()
-        try:
-            param_value = f"%{kyt_id}%"
-            sql_query = "SELECT TOP (5000) * FROM [indigo_cct].[dbo].[MCLOG] WITH (NOLOCK) WHERE OUTRAS_INFO LIKE ? ORDER BY id DESC"
-            cursor.execute(sql_query, (param_value,))
-            return self._format_results(cursor)
-        except pyodbc.Error as ex:
-            st.error(f"Erro ao executar a busca por ID KYT: {ex}")
-            return []
-        finally:
-            cursor.close()
+        if not kyt_id: return pd.DataFrame() # Bifurcação: evita busca desnecessária se o input for vazio.
+        param_value = f"%{kyt_id}%"
+        sql_query = "SELECT TOP (5000) * FROM [indigo_cct].[dbo].[MCLOG] WITH (NOLOCK) WHERE OUTRAS_INFO LIKE ? ORDER BY id DESC OPTION (FAST 5000)"
+        return run_cached_query(sql_query, (param_value,), refresh_nonce)
 
 # --- Repositório para o Histórico de Jobs ---
 class JobRepository:
     """
     Gerencia a consulta ao histórico de jobs do SQL Server Agent.
     """
-    def __init__(self, connection):
-        self._connection = connection
+    def __init__(self, pool: ConnectionPool):
+        self._pool = pool
 
-    def _format_results(self, cursor) -> List[Dict[str, Any]]:
-        """Função auxiliar para formatar resultados do banco de dados."""
-        columns = [column[0] for column in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    def _format_results(self, cursor) -> pd.DataFrame:
+        """Função auxiliar para formatar resultados do banco de dados como DataFrame, lendo em lotes."""
+        return _fetch_dataframe(cursor)
 
-    def get_job_history(self) -> List[Dict[str, Any]]:
+    def get_job_history(self) -> pd.DataFrame:
         """Busca o histórico do job 'Fechamento e Abertura do Sistema de Tesouraria/CC'."""
-        cursor = self._connection.cursor()
+        sql_query = """
+            SELECT
+                j.name AS [JobName],
+                SUBSTRING(CAST(h.run_date AS VARCHAR(8)), 7, 2) + '-' + SUBSTRING(CAST(h.run_date AS VARCHAR(8)), 5, 2) + '-' + SUBSTRING(CAST(h.run_date AS VARCHAR(8)), 1, 4) AS RunDate,  -- Data da execução (formato DD-MM-YYYY)
+                h.run_time AS RunTime,  -- Horário bruto (formato HHMMSS, pode ser ignorado)
+                msdb.dbo.agent_datetime(h.run_date, h.run_time) AS RunDateTime, -- Data/hora real da execução
+                STUFF(STUFF(RIGHT('000000' + CAST(h.run_duration AS VARCHAR(6)), 6), 3, 0, ':'), 6, 0, ':') AS RunDuration,  -- Duração do job (HHMMSS)
+                CASE h.run_status  -- Status da execução (NÃO ALTERAR valores)
+                    WHEN 0 THEN 'Failed'
+                    WHEN 1 THEN 'Succeeded'
+                    WHEN 2 THEN 'Retry'
+                    WHEN 3 THEN 'Canceled'
+                    WHEN 4 THEN 'In Progress'
+                END AS ExecutionStatus, 
+                h.message AS SystemMessage  -- Mensagem de log retornada pelo SQL Agent
+            FROM msdb.dbo.sysjobs j
+            INNER JOIN msdb.dbo.sysjobhistory h
+                ON j.job_id = h.job_id
+            WHERE h.step_id = 0   -- step_id = 0 = resultado consolidado do job (não de steps individuais)
+              AND j.name = 'Fechamento e Abertura do Sistema de Tesouraria/CC'
+            ORDER BY RunDateTime DESC;
+        """
+        # O try fica FORA do borrow(): um OperationalError precisa atravessar o
+        # contextmanager para que o pool descarte a conexão morta e a reponha,
+        # antes de o erro virar banner aqui.
         try:
-            sql_query = """
-                SELECT  
-                    j.name AS [JobName], 
-                    SUBSTRING(CAST(h.run_date AS VARCHAR(8)), 7, 2) + '-' + SUBSTRING(CAST(h.run_date AS VARCHAR(8)), 5, 2) + '-' + SUBSTRING(CAST(h.run_date AS VARCHAR(8)), 1, 4) AS RunDate,  -- Data da execução (formato DD-MM-YYYY)
-                    h.run_time AS RunTime,  -- Horário bruto (formato HHMMSS, pode ser ignorado)
-                    msdb.dbo.agent_datetime(h.run_date, h.run_time) AS RunDateTime, -- Data/hora real da execução
-                    STUFF(STUFF(RIGHT('000000' + CAST(h.run_duration AS VARCHAR(6)), 6), 3, 0, ':'), 6, 0, ':') AS RunDuration,  -- Duração do job (HHMMSS)
-                    CASE h.run_status  -- Status da execução (NÃO ALTERAR valores)
-                        WHEN 0 THEN 'Failed'
-                        WHEN 1 THEN 'Succeeded'
-                        WHEN 2 THEN 'Retry'
-                        WHEN 3 THEN 'Canceled'
-                        WHEN 4 THEN 'In Progress'
-                    END AS ExecutionStatus, 
-                    h.message AS SystemMessage  -- Mensagem de log retornada pelo SQL Agent
-                FROM msdb.dbo.sysjobs j
-                INNER JOIN msdb.dbo.sysjobhistory h
-                    ON j.job_id = h.job_id
-                WHERE h.step_id = 0   -- step_id = 0 = resultado consolidado do job (não de steps individuais)
-                  AND j.name = 'Fechamento e Abertura do Sistema de Tesouraria/CC'
-                ORDER BY RunDateTime DESC;
-            """
-            cursor.execute(sql_query)
-            return self._format_results(cursor)
+            with self._pool.borrow() as connection:
+                cursor = connection.cursor()
+                cursor.arraysize = FETCH_BATCH_SIZE
+                try:
+                    cursor.execute(sql_query)
+                    return self._format_results(cursor)
+                finally:
+                    cursor.close()
         except pyodbc.Error as ex:
             st.error(f"Erro ao consultar o histórico de jobs: {ex}")
-            return []
-        finally:
-            cursor.close()
+            return pd.DataFrame()
 
 # --- Funções e Interface da Aplicação Streamlit ---
 
+def fan_out(calls):
+    """
+    Executa várias chamadas de repositório em paralelo e retorna os resultados na mesma ordem.
+
+    Cada query pega sua própria conexão emprestada do pool e o pyodbc libera a GIL durante
+    o execute, então as idas ao banco se sobrepõem: o tempo total vira o da query mais lenta
+    em vez da soma de todas.
+
+    As threads do executor não têm ScriptRunContext, então nada de Streamlit pode ser
+    renderizado dentro delas: erros de banco são capturados e devolvidos no lugar do
+    resultado, para que o chamador os exiba na thread principal (ver _surface_db_error).
+
+    Args:
+        calls: Lista de tuplas (função, tupla_de_argumentos) a serem despachadas.
+    """
+    def _invoke(fn, args):
+        try:
+            return fn(*args)
+        except pyodbc.Error as ex:
+            # Bifurcação: a exceção vira valor de retorno; quem renderiza é o chamador.
+            return ex
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        futures = [executor.submit(_invoke, fn, args) for fn, args in calls]
+        return [future.result() for future in futures]
+
+def _surface_db_error(result, context: str) -> pd.DataFrame:
+    """
+    Exibe na thread principal um erro de banco capturado pelo fan_out, devolvendo um
+    DataFrame vazio no lugar do resultado; resultados normais passam direto.
+    """
+    # Bifurcação: a chamada paralela falhou; o banner é renderizado aqui.
+    if isinstance(result, pyodbc.Error):
+        st.error(f"{context}: {result}")
+        return pd.DataFrame()
+    return result
+
+# Palavras-chave que identificam a linha com a decisão final do KYT na MCLOG CCT,
+# compiladas uma única vez em um regex case-insensitive.
+_DECISION_RE = re.compile(
+    '|'.join(re.escape(keyword) for keyword in
+             ['aprovado', 'rejeitado', 'approved', 'rejected', '"ALLOW"', '"DENY"']),
+    re.IGNORECASE,
+)
+
+# Sentinela para distinguir "sem JSON válido" de valores JSON legítimos (ex: null).
+_JSON_INVALIDO = object()
+
+@lru_cache(maxsize=512)
+def _parse_json_payload(content: str):
+    """
+    Extrai e decodifica o JSON contido em uma string de log (ex: 'prefixo = {...}').
+    Usa orjson (parser em C, bem mais rápido que o módulo json) e memoiza o resultado,
+    já que o Streamlit reexecuta o script a cada interação e os mesmos payloads são
+    re-renderizados várias vezes.
+
+    Returns:
+        O valor decodificado, ou `_JSON_INVALIDO` se o conteúdo não tiver JSON válido.
+    """
+    json_part = content
+    # Bifurcação: Verifica se a string parece conter um JSON aninhado.
+    if '{' in content:
+        # Encontra o início do JSON e extrai a substring a partir dele.
+        json_start_index = content.find('{')
+        json_part = content[json_start_index:]
+    try:
+        return orjson.loads(json_part)
+    except orjson.JSONDecodeError:
+        return _JSON_INVALIDO
+
 def display_json_or_text(content: str):
     """
     Renderiza um conteúdo como JSON se for válido, caso contrário, exibe como texto simples.
@@ -458,80 +813,65 @@ def display_json_or_text(content: str):
         # Bifurcação: Trata casos de conteúdo nulo ou que não é string.
         st.info("Conteúdo vazio ou não é texto.")
         return
-    
-    json_part = content
-    # Bifurcação: Verifica se a string parece conter um JSON aninhado.
-    if '{' in content:
-        # Encontra o início do JSON e extrai a substring a partir dele.
-        json_start_index = content.find('{')
-        json_part = content[json_start_index:]
 
-    try:
-        # Bifurcação: Tenta o parse da parte extraída da string.
-        parsed_json = json.loads(json_part)
-        st.json(parsed_json, expanded=True) # Exibe expandido por padrão para clareza
-    except json.JSONDecodeError:
-        # Bifurcação: Se o parse falhar, exibe o conteúdo original como texto.
+    parsed_json = _parse_json_payload(content)
+    # Bifurcação: Se o parse falhar, exibe o conteúdo original como texto.
+    if parsed_json is _JSON_INVALIDO:
         st.code(content, language=None)
+    else:
+        st.json(parsed_json, expanded=True) # Exibe expandido por padrão para clareza
+
+@st.cache_data(ttl=300, show_spinner=False, max_entries=8)
+def _ops_pivot(ops_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte o resultado longo (Minuto, FUNCAO, NumeroDeOperacoes) para o formato
+    largo usado pelo gráfico de barras, uma única vez por conjunto de dados.
+    O filtro "Filtre as Funções" vira um recorte puro de colunas sobre este
+    DataFrame cacheado, em vez de refazer máscara + pivot a cada interação.
+    """
+    # FUNCAO já chega categórica do repositório (downcast na ingestão).
+    return ops_data.pivot(index='Minuto', columns='FUNCAO', values='NumeroDeOperacoes').fillna(0).astype('float32')
+
+@st.cache_data(ttl=300, show_spinner=False, max_entries=8)
+def _df_to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Serializa um DataFrame para CSV uma única vez por conjunto de dados (para download)."""
+    return df.to_csv(index=False).encode('utf-8-sig')
 
 # --- LÓGICA DE GERENCIAMENTO DE CONEXÃO RESILIENTE ---
 
 def init_connection():
     """
-    Cria a conexão com o banco de dados e inicializa os repositórios.
-    Armazena o objeto de conexão e os repositórios no st.session_state.
+    Obtém o pool de conexões compartilhado e inicializa os repositórios.
+    A verificação de liveness por rerun foi removida: o próprio pool descarta
+    e substitui conexões que falharem no momento do uso.
     """
+    # Bifurcação: reaproveita os repositórios da sessão, preservando os cursores
+    # preparados de longa duração entre reruns.
+    if st.session_state.get("repos") is not None:
+        return st.session_state.repos
     try:
-        connection = pyodbc.connect(st.secrets["database"]["connection_string"])
-        st.session_state.db_connection = connection
+        pool = get_pool()
         st.session_state.repos = {
-            "tixlog": TixlogRepository(connection),
-            "mclog": MclogRepository(connection),
-            "mix100": Mix100Repository(connection),
-            "mclog_cct": MclogCctRepository(connection),
-            "job": JobRepository(connection)
+            "tixlog": TixlogRepository(pool),
+            "mclog": MclogRepository(pool),
+            "mix100": Mix100Repository(pool),
+            "mclog_cct": MclogCctRepository(pool),
+            "job": JobRepository(pool)
         }
         return st.session_state.repos
     except Exception as e:
         st.error(f"Erro ao conectar ao banco de dados: {e}")
         st.warning("Verifique se o arquivo `.streamlit/secrets.toml` está configurado corretamente.")
         # Limpa o estado para forçar uma nova tentativa na próxima interação.
-        st.session_state.db_connection = None
         st.session_state.repos = None
         return None
 
-def check_connection():
-    """
-    Verifica se a conexão com o banco de dados está ativa. Se não estiver,
-    tenta reconectar. Retorna os repositórios se a conexão estiver OK.
-    """
-    # Bifurcação: Se não houver conexão no estado da sessão, cria uma nova.
-    if "repos" not in st.session_state or st.session_state.repos is None:
-        return init_connection()
-    
-    cursor = None
-    try:
-        # Tenta executar uma query simples e rápida para validar a conexão, usando um cursor temporário.
-        cursor = st.session_state.db_connection.cursor()
-        cursor.execute("SELECT 1")
-        # Se a query funcionar, a conexão está boa e podemos retornar os repositórios existentes.
-        return st.session_state.repos
-    except (pyodbc.OperationalError, pyodbc.ProgrammingError) as e:
-        # Bifurcação: Se a query falhar, a conexão caiu.
-        st.warning("Conexão com o banco de dados perdida. Tentando reconectar...")
-        # Tenta criar uma nova conexão.
-        return init_connection()
-    finally:
-        # Garante que o cursor de verificação seja sempre fechado.
-        if cursor:
-            cursor.close()
-
 # --- Configuração da Página Principal ---
 st.set_page_config(layout="wide", page_title="Visualizador de Logs e Estatísticas")
 st.title("🔎 Visualizador de Logs e Estatísticas")
 
-# Garante que temos uma conexão válida no início de cada execução.
-repos = check_connection()
+# Garante que os repositórios estejam inicializados no início de cada execução.
+repos = init_connection()
 
 # --- Navegação Principal ---
 st.sidebar.header("Navegação")
@@ -565,12 +905,6 @@ if app_mode == "Busca 360º":
     )
 
     input_container = st.container()
-    
-    # Placeholders para os resultados
-    summary_placeholder = st.empty()
-    results_placeholder_1 = st.empty()
-    results_placeholder_2 = st.empty()
-    results_placeholder_3 = st.empty()
 
     with input_container:
         # Bifurcação: Renderiza o campo de input apropriado para o tipo de busca.
@@ -591,6 +925,7 @@ if app_mode == "Busca 360º":
              key = search_type.replace(":", "_").replace(" ", "_").lower()
              input_value = st.text_input(label, key=key)
         
+        force_refresh = st.checkbox("Forçar atualização (ignorar o cache de resultados)", key="force_refresh")
         search_clicked = st.button("Buscar", key="search_button")
 
     def display_mix100_details(df):
@@ -598,7 +933,8 @@ if app_mode == "Busca 360º":
         # Bifurcação: Só exibe se a coluna de status existir e houver dados.
         if 'STATUS_MENSAGEM' in df.columns and not df.empty:
             st.write("---")
-            latest_status = df['STATUS_MENSAGEM'].iloc[0]
+            # .iat devolve o escalar direto, sem o caminho mais genérico (e mais caro) do .iloc.
+            latest_status = df['STATUS_MENSAGEM'].iat[0]
             status_map = {'D': 'Devolvido', 'A': 'Aguardando', 'L': 'Liquidado', 'V': 'Valor Vazio/Desconhecido', 'E': 'Erro'}
             status_description = status_map.get(latest_status, f"Status Desconhecido ({latest_status})")
             
@@ -611,15 +947,31 @@ if app_mode == "Busca 360º":
             st.caption("Legenda Status: D = Devolvido, A = Aguardando, L = Liquidado, E = Erro, V = Valor Vazio/Desconhecido")
 
     def display_tixlog_details(df):
-        """Exibe os conteúdos JSON de forma expansível para resultados da TIXLOG."""
-        # Bifurcação: Só exibe a seção se a coluna JSON existir.
-        if 'JSON' in df.columns:
+        """
+        Exibe os conteúdos JSON de forma expansível para resultados da TIXLOG.
+        As buscas de listagem não trazem mais os blobs JSON; cada payload é buscado
+        sob demanda (e cacheado) quando o usuário aciona o toggle dentro do expander.
+        """
+        # Bifurcação: Só exibe a seção se houver resultados da TIXLOG com ID.
+        if 'ID' in df.columns and not df.empty:
             st.subheader("Detalhes dos JSONs (TIXLOG)")
-            for _, row in df.iterrows():
-                expander_title = f"ID: {row['ID']} | NR_CONTROLE: {row.get('NR_CONTROLE', 'N/A')} | ORIGEM: {row.get('ORIGEM', 'N/A')}"
+            # itertuples devolve tuplas puras — sem construir uma Series por linha como o
+            # iterrows — então as posições das colunas são resolvidas uma única vez aqui.
+            idx = {column: position for position, column in enumerate(df.columns)}
+            id_pos = idx['ID']
+            nr_pos = idx.get('NR_CONTROLE')
+            origem_pos = idx.get('ORIGEM')
+            for row in df.itertuples(index=False, name=None):
+                nr_controle = row[nr_pos] if nr_pos is not None else 'N/A'
+                origem = row[origem_pos] if origem_pos is not None else 'N/A'
+                expander_title = f"ID: {row[id_pos]} | NR_CONTROLE: {nr_controle} | ORIGEM: {origem}"
                 with st.expander(expander_title):
-                    st.write("**JSON Enviado:**"); display_json_or_text(row.get('JSON'))
-                    st.write("**JSON de Retorno:**"); display_json_or_text(row.get('JSON_RETORNO'))
+                    # O corpo do expander executa mesmo fechado; o toggle garante que o
+                    # payload só atravesse a rede quando o usuário realmente pedir.
+                    if st.toggle("Carregar JSONs", key=f"tixlog_json_{row[id_pos]}"):
+                        json_enviado, json_retorno = repos["tixlog"].get_jsons(row[id_pos])
+                        st.write("**JSON Enviado:**"); display_json_or_text(json_enviado)
+                        st.write("**JSON de Retorno:**"); display_json_or_text(json_retorno)
 
     def display_mclog_cct_details(df):
         """
@@ -628,15 +980,11 @@ if app_mode == "Busca 360º":
         """
         # Bifurcação: Procede apenas se a coluna OUTRAS_INFO existir e houver dados.
         if 'OUTRAS_INFO' in df.columns and not df.empty:
-            decision_keywords = ['aprovado', 'rejeitado', 'approved', 'rejected', '"ALLOW"', '"DENY"']
-            decision_row = None
-
-            # Itera sobre os resultados para encontrar a linha com a decisão.
-            for index, row in df.iterrows():
-                outras_info_str = row.get('OUTRAS_INFO')
-                if isinstance(outras_info_str, str) and any(keyword.lower() in outras_info_str.lower() for keyword in decision_keywords):
-                    decision_row = row
-                    break  # Para no primeiro resultado encontrado.
+            # Aplica o regex pré-compilado de forma vetorizada sobre a coluna inteira,
+            # em vez de iterar linha a linha re-minusculando a string para cada palavra-chave.
+            mask = df['OUTRAS_INFO'].fillna('').astype(str).str.contains(_DECISION_RE, na=False)
+            # Bifurcação: pega a primeira linha com decisão, se existir.
+            decision_row = df.loc[mask].iloc[0] if mask.any() else None
 
             # Bifurcação: Se uma linha com a decisão foi encontrada, exibe os detalhes.
             if decision_row is not None:
@@ -667,40 +1015,83 @@ if app_mode == "Busca 360º":
     def display_results(placeholder, title, results, details_func=None):
         """
         Função genérica para renderizar um DataFrame e seus detalhes em um placeholder.
-        Foi refatorada para ser mais flexível.
+        A tabela fica em um expander com a contagem de linhas no título, mostrando uma
+        prévia das 200 primeiras; o conjunto completo sai por download. Os painéis de
+        detalhes permanecem fora do expander porque contêm expanders próprios (o
+        Streamlit não permite aninhá-los).
         """
         with placeholder.container():
             # Bifurcação: Só renderiza se houver resultados.
-            if results:
+            if results is not None and not results.empty:
                 st.subheader(title)
-                df = pd.DataFrame(results)
+                df = results
+                total = len(df)
                 
                 # Passo 1: Exibe detalhes que devem aparecer ACIMA da tabela (ex: status da MIX100 ou decisão do KYT).
                 if details_func in [display_mix100_details, display_mclog_cct_details]:
                     details_func(df)
                 
-                # Passo 2: Exibe a tabela principal, suprimindo colunas se necessário.
-                cols_to_show = df.columns
-                if details_func == display_tixlog_details:
-                    cols_to_show = [col for col in df.columns if col not in ['JSON', 'JSON_RETORNO']]
-                st.dataframe(df[cols_to_show])
+                # Passo 2: Tabela principal. Resultados pequenos já abrem expandidos;
+                # os grandes ficam fechados para não dominar o custo do rerun.
+                with st.expander(f"Tabela de resultados ({total:,} linhas)", expanded=total < 50):
+                    st.dataframe(df.head(200))
+                    # Bifurcação: acima da prévia, oferece o conjunto completo por download.
+                    if total > 200:
+                        st.caption(f"Exibindo 200 de {total:,} linhas.")
+                        st.download_button("Baixar CSV completo", _df_to_csv_bytes(df),
+                                           "resultados.csv", "text/csv", key=f"dl_{title}")
 
                 # Passo 3: Exibe detalhes que devem aparecer ABAIXO da tabela (ex: JSONs da TIXLOG).
                 if details_func == display_tixlog_details:
                     details_func(df)
 
-    # Ação principal: executada somente quando o botão de busca é clicado.
-    if search_clicked and repos:
-        summary_placeholder.empty(); results_placeholder_1.empty(); results_placeholder_2.empty(); results_placeholder_3.empty()
+    # Despacho por dicionário: os tipos de busca simples (uma query, um resultado)
+    # mapeiam para (repositório, método, título, função de detalhes, texto do spinner,
+    # mensagem de erro),
+    # em vez de uma cascata de comparações de string. As buscas compostas (360º e as
+    # variantes TIXLOG com complemento) continuam como ramos próprios construídos
+    # sobre as mesmas primitivas.
+    SIMPLE_HANDLERS = {
+        "MIX100: Por EndToEndId Devolução": ("mix100", "find_by_endtoendiddevolucao", "Resultados em MIX100", display_mix100_details, "Buscando em MIX100...", "Erro ao executar a busca por EndToEndId Devolução"),
+        "MCLOG CCT: Por ID da Transação KYT": ("mclog_cct", "find_by_kyt_id", "Resultados em MCLOG CCT", display_mclog_cct_details, "Buscando em MCLOG CCT...", "Erro ao executar a busca por ID KYT"),
+        "MCLOG CAD: Busca Geral em OUTRAS_INFO": ("mclog", "find_by_outras_info", "Resultados em MCLOG CAD", None, "Buscando em MCLOG CAD...", "Erro ao executar a busca em MCLOG"),
+    }
+
+    # Método principal na TIXLOG para cada variante com complemento na MCLOG CAD.
+    TIXLOG_PRIMARY_METHODS = {
+        "TIXLOG: Por NR_CONTROLE": "find_by_nr_controle",
+        "TIXLOG: Por IDREQJDPI": "find_by_idreqjdpi",
+        "TIXLOG: Por Conteúdo no JSON (LIKE)": "find_by_json_content",
+        "TIXLOG: Por Origem": "find_by_origem",
+    }
+
+    # Ação principal, isolada em um fragment: interações com widgets internos
+    # (os toggles de JSON dos expanders) re-executam apenas este bloco, não o
+    # script inteiro — a sidebar, o selectbox e o init não rodam de novo. Em um
+    # rerun de fragment os argumentos mantêm os valores da última execução
+    # completa, então os resultados da busca clicada continuam na tela (as
+    # queries repetidas saem do st.cache_data).
+    @st.fragment
+    def run_search(search_type: str, input_value: str, search_clicked: bool, refresh_nonce: int):
+        # Placeholders para os resultados
+        summary_placeholder = st.empty()
+        results_placeholder_1 = st.empty()
+        results_placeholder_2 = st.empty()
+        results_placeholder_3 = st.empty()
+
+        # Bifurcação: nada a renderizar antes do clique em Buscar (ou sem conexão).
+        if not search_clicked or not repos:
+            return
+
         
         # Bifurcação: Trata a busca 360º e a busca por NR_CONTROLE na TIXLOG, que exibem o sumário.
         if search_type == "MIX100: Por NR_CONTROLE (Busca 360º)" or search_type == "TIXLOG: Por NR_CONTROLE":
             with st.spinner("Analisando tempo da transação..."):
                 summary_data = repos["tixlog"].get_transaction_summary(input_value)
             with summary_placeholder.container():
-                if summary_data:
+                if not summary_data.empty:
                     st.subheader("Sumário da Transação (TIXLOG)")
-                    summary = summary_data[0]
+                    summary = summary_data.iloc[0]
                     col1, col2, col3 = st.columns(3)
                     col1.metric("Tipo de Operação", summary.get('Tipo_Operacao', 'N/A'))
                     col2.metric("Tempo Total (ms)", f"{summary.get('Intervalo_Total_MS', 0):,}")
@@ -708,52 +1099,76 @@ if app_mode == "Busca 360º":
                     st.divider()
 
         if search_type == "MIX100: Por NR_CONTROLE (Busca 360º)":
-            with st.spinner("Buscando em MIX100..."): mix100_results = repos["mix100"].find_by_nr_controle(input_value)
+            # As três buscas são independentes; despacha em paralelo para que a latência
+            # total seja a da mais lenta, e não a soma das três.
+            with st.spinner("Buscando em MIX100, TIXLOG e MCLOG CAD..."):
+                mix100_results, tixlog_results, mclog_results = fan_out([
+                    (repos["mix100"].find_by_nr_controle, (input_value, refresh_nonce)),
+                    (repos["tixlog"].find_by_nr_controle, (input_value, refresh_nonce)),
+                    (repos["mclog"].find_by_outras_info, (input_value, refresh_nonce)),
+                ])
+            mix100_results = _surface_db_error(mix100_results, "Erro ao executar a busca em MIX100")
+            tixlog_results = _surface_db_error(tixlog_results, "Erro ao executar a busca em TIXLOG")
+            mclog_results = _surface_db_error(mclog_results, "Erro ao executar a busca em MCLOG")
             display_results(results_placeholder_1, "Resultados em MIX100", mix100_results, display_mix100_details)
-            with st.spinner("Buscando em TIXLOG..."): tixlog_results = repos["tixlog"].find_by_nr_controle(input_value)
             display_results(results_placeholder_2, "Resultados Complementares em TIXLOG", tixlog_results, display_tixlog_details)
-            with st.spinner("Buscando em MCLOG CAD..."): mclog_results = repos["mclog"].find_by_outras_info(input_value)
             display_results(results_placeholder_3, "Resultados Complementares em MCLOG CAD", mclog_results)
-            if not mix100_results and not tixlog_results and not mclog_results: results_placeholder_1.info("Nenhum resultado encontrado.")
+            if mix100_results.empty and tixlog_results.empty and mclog_results.empty: results_placeholder_1.info("Nenhum resultado encontrado.")
         
-        elif search_type == "MIX100: Por EndToEndId Devolução":
-            with st.spinner("Buscando em MIX100..."): mix100_results = repos["mix100"].find_by_endtoendiddevolucao(input_value)
-            display_results(results_placeholder_1, "Resultados em MIX100", mix100_results, display_mix100_details)
-            if not mix100_results: results_placeholder_1.info("Nenhum resultado encontrado.")
-
-        elif search_type == "MCLOG CCT: Por ID da Transação KYT":
-            with st.spinner("Buscando em MCLOG CCT..."):
-                kyt_results = repos["mclog_cct"].find_by_kyt_id(input_value)
-            # Passa a nova função de detalhes para a exibição dos resultados.
-            display_results(results_placeholder_1, "Resultados em MCLOG CCT", kyt_results, display_mclog_cct_details)
-            if not kyt_results:
-                results_placeholder_1.info("Nenhum resultado encontrado.")
+        elif search_type in SIMPLE_HANDLERS:
+            repo_key, method_name, title, details_fn, spinner_msg, error_msg = SIMPLE_HANDLERS[search_type]
+            with st.spinner(spinner_msg):
+                try:
+                    results = getattr(repos[repo_key], method_name)(input_value, refresh_nonce)
+                except pyodbc.Error as ex:
+                    # Bifurcação: os métodos de busca propagam erros de banco; o banner é daqui.
+                    st.error(f"{error_msg}: {ex}")
+                    results = pd.DataFrame()
+            display_results(results_placeholder_1, title, results, details_fn)
+            if results.empty: results_placeholder_1.info("Nenhum resultado encontrado.")
 
         elif search_type.startswith("TIXLOG"):
-            primary_results, complementary_results = [], []
-            with st.spinner(f"Buscando em TIXLOG..."):
-                if search_type == "TIXLOG: Por NR_CONTROLE": primary_results = repos["tixlog"].find_by_nr_controle(input_value)
-                elif search_type == "TIXLOG: Por IDREQJDPI": primary_results = repos["tixlog"].find_by_idreqjdpi(input_value)
-                elif search_type == "TIXLOG: Por Lista de NR_CONTROLE (IN)":
-                    nr_list = [line.strip() for line in input_value.split('\n') if line.strip()]
-                    if nr_list: primary_results = repos["tixlog"].find_by_nr_controle_in(nr_list)
-                elif search_type == "TIXLOG: Por Conteúdo no JSON (LIKE)": primary_results = repos["tixlog"].find_by_json_content(input_value)
-                elif search_type == "TIXLOG: Por Origem": primary_results = repos["tixlog"].find_by_origem(input_value)
+            # A busca principal na TIXLOG e o complemento na MCLOG são independentes;
+            # como na busca 360º, despacha os dois em paralelo e renderiza no fim
+            # (os elementos do Streamlit só podem ser escritos pela thread principal).
+            primary_results, complementary_results = pd.DataFrame(), pd.DataFrame()
+            if search_type == "TIXLOG: Por Lista de NR_CONTROLE (IN)":
+                # Tupla (imutável/hasheável) computada uma única vez e compartilhada pelas
+                # duas buscas — também serve como chave estável para o st.cache_data.
+                nr_list = tuple(line.strip() for line in input_value.split('\n') if line.strip())
+
+                if nr_list:
+                    with st.spinner("Buscando em TIXLOG e MCLOG CAD..."):
+                        primary_results, complementary_results = fan_out([
+                            (repos["tixlog"].find_by_nr_controle_in, (nr_list, refresh_nonce)),
+                            (repos["mclog"].find_by_outras_info_in, (nr_list, refresh_nonce)),
+                        ])
+                    primary_results = _surface_db_error(primary_results, "Erro ao executar a busca em TIXLOG")
+                    complementary_results = _surface_db_error(complementary_results, "Erro ao executar a busca em MCLOG")
+                else:
+                    # Bifurcação: lista vazia não dispara busca alguma.
+                    st.warning("Informe ao menos um NR_CONTROLE na lista.")
+            else:
+                # A busca principal sai da tabela de despacho; o complemento na MCLOG é sempre o mesmo.
+                primary_fn = getattr(repos["tixlog"], TIXLOG_PRIMARY_METHODS[search_type])
+                with st.spinner("Buscando em TIXLOG e MCLOG CAD..."):
+                    primary_results, complementary_results = fan_out([
+                        (primary_fn, (input_value, refresh_nonce)),
+                        (repos["mclog"].find_by_outras_info, (input_value, refresh_nonce)),
+                    ])
+                primary_results = _surface_db_error(primary_results, "Erro ao executar a busca em TIXLOG")
+                complementary_results = _surface_db_error(complementary_results, "Erro ao executar a busca em MCLOG")
             display_results(results_placeholder_1, f"Resultados Principais em TIXLOG", primary_results, display_tixlog_details)
-            with st.spinner("Buscando complemento em MCLOG CAD..."):
-                if search_type == "TIXLOG: Por Lista de NR_CONTROLE (IN)":
-                    nr_list = [line.strip() for line in input_value.split('\n') if line.strip()]
-                    if nr_list:
-                        temp_complementary = [item for sublist in [repos["mclog"].find_by_outras_info(item) for item in nr_list] for item in sublist]
-                        if temp_complementary: complementary_results = pd.DataFrame(temp_complementary).drop_duplicates().to_dict('records')
-                else: complementary_results = repos["mclog"].find_by_outras_info(input_value)
             display_results(results_placeholder_2, "Resultados Complementares em MCLOG CAD", complementary_results)
-            if not primary_results and not complementary_results: results_placeholder_1.info("Nenhum resultado encontrado.")
+            if primary_results.empty and complementary_results.empty: results_placeholder_1.info("Nenhum resultado encontrado.")
 
-        elif search_type == "MCLOG CAD: Busca Geral em OUTRAS_INFO":
-            with st.spinner("Buscando em MCLOG CAD..."): mclog_results = repos["mclog"].find_by_outras_info(input_value)
-            display_results(results_placeholder_1, "Resultados em MCLOG CAD", mclog_results)
-            if not mclog_results: results_placeholder_1.info("Nenhum resultado encontrado.")
+    # O nonce só muda no run do clique real em Buscar com "Forçar atualização" marcada:
+    # reruns do fragment (toggles de JSON) reexecutam run_search com o MESMO nonce, então
+    # as queries repetidas saem do cache em vez de irem ao banco de novo.
+    if search_clicked and force_refresh:
+        st.session_state.search_refresh_nonce = st.session_state.get("search_refresh_nonce", 0) + 1
+
+    run_search(search_type, input_value, search_clicked, st.session_state.get("search_refresh_nonce", 0))
 
 # --- LÓGICA DA PÁGINA DE ESTATÍSTICAS ---
 elif app_mode == "Estatísticas":
@@ -767,10 +1182,9 @@ elif app_mode == "Estatísticas":
             with st.spinner("Calculando estatísticas da TIXLOG..."):
                 stats_data = repos["tixlog"].get_new_entries_per_minute()
             
-            if stats_data:
-                df_stats = pd.DataFrame(stats_data)
-                df_stats['MinutoFormatado'] = pd.to_datetime(df_stats['MinutoFormatado'])
-                df_stats = df_stats.set_index('MinutoFormatado')
+            if not stats_data.empty:
+                # O repositório já entrega o DataFrame indexado por minuto (datetime).
+                df_stats = stats_data
                 
                 st.write("Gráfico de Novas Entradas por Minuto (TIXLOG)")
                 st.line_chart(df_stats['NovosNrControlePorMinuto'])
@@ -793,40 +1207,45 @@ elif app_mode == "Estatísticas":
         selected_time_label = st.selectbox("Selecione o Período:", options=time_options.keys(), key="mclog_time")
         selected_hours = time_options[selected_time_label]
 
-    filter_placeholder = st.empty()
+    # O filtro é populado por uma query DISTINCT minúscula (cacheada), independente
+    # dos dados do gráfico — o widget aparece imediatamente, antes de qualquer clique.
+    all_functions = repos["mclog"].list_functions() if repos else []
+    selected_functions = st.multiselect("Filtre as Funções:", options=all_functions, default=all_functions)
     
     if st.button("Gerar Gráfico de Operações"):
         # Bifurcação: Lógica para o segundo gráfico e a tabela de erros.
         if repos:
             with st.spinner(f"Calculando estatísticas da MCLOG ({selected_time_label})..."):
-                ops_data = repos["mclog"].get_operations_per_minute(hours_ago=selected_hours)
+                # Uma única ida ao banco traz o gráfico de operações e a tabela de erros.
+                ops_data, error_data = repos["mclog"].get_stats_bundle(hours_ago=selected_hours)
             
-            if ops_data:
-                df_ops = pd.DataFrame(ops_data)
-                all_functions = sorted(df_ops['FUNCAO'].unique())
-                with filter_placeholder:
-                    selected_functions = st.multiselect("Filtre as Funções:", options=all_functions, default=all_functions)
+            if not ops_data.empty:
+                df_ops = ops_data
+                pivot_df = _ops_pivot(df_ops)
+                # Bifurcação: o período do gráfico pode não conter todas as funções do filtro (24h).
+                chart_columns = [funcao for funcao in selected_functions if funcao in pivot_df.columns]
                 
-                if selected_functions:
-                    df_ops_filtered = df_ops[df_ops['FUNCAO'].isin(selected_functions)]
-                    pivot_df = df_ops_filtered.pivot(index='Minuto', columns='FUNCAO', values='NumeroDeOperacoes').fillna(0)
+                if chart_columns:
+                    # Recorte de colunas sobre o pivot cacheado; nada é recalculado aqui.
                     st.write(f"Gráfico de Operações por Função por Minuto (MCLOG) - {selected_time_label}")
-                    st.bar_chart(pivot_df)
+                    st.bar_chart(pivot_df[chart_columns])
                 else:
                     st.warning("Selecione ao menos uma função para exibir o gráfico.")
                 
                 with st.expander("Ver dados brutos de operações"):
-                    st.dataframe(df_ops)
+                    # Renderiza no máximo 1000 linhas; o conjunto completo sai por download.
+                    st.dataframe(df_ops.head(1000))
+                    if len(df_ops) > 1000:
+                        st.caption(f"Exibindo 1.000 de {len(df_ops):,} linhas.")
+                    st.download_button("Baixar CSV completo", _df_to_csv_bytes(df_ops),
+                                       "operacoes_por_minuto.csv", "text/csv")
             else:
                 st.info(f"Nenhuma operação encontrada na MCLOG no período de {selected_time_label}.")
 
             st.write("---")
-            with st.spinner("Buscando últimos erros na MCLOG..."):
-                error_data = repos["mclog"].get_latest_errors()
-            
-            if error_data:
+            if not error_data.empty:
                 st.subheader("Últimos Erros Registrados na MCLOG (IAE = 'E')")
-                df_errors = pd.DataFrame(error_data)
+                df_errors = error_data
                 st.dataframe(df_errors)
             else:
                 st.info("Nenhum erro (IAE = 'E') encontrado na MCLOG nas últimas 24 horas.")
@@ -846,36 +1265,49 @@ elif app_mode == "Estatísticas":
             with st.spinner(f"Buscando e analisando dados de performance ({selected_perf_mode_label})..."):
                 perf_data = repos["tixlog"].get_performance_summary_data(mode=selected_perf_mode)
             
-            if perf_data:
-                df_perf = pd.DataFrame(perf_data)
-                df_in = df_perf[df_perf['Tipo_Operacao'] == 'IN']
-                df_out = df_perf[df_perf['Tipo_Operacao'] == 'OUT']
+            if not perf_data.empty:
+                df_perf = perf_data
+                # Todas as métricas saem de uma única passada groupby/agg sobre a coluna
+                # de intervalos, em vez de 8 reduções separadas sobre dois sub-DataFrames
+                # mascarados por tipo de operação.
+                perf_stats = df_perf.groupby('Tipo_Operacao', observed=True)['Intervalo_Total_MS'].agg(
+                    Media='mean',
+                    Mediana='median',
+                    P95=lambda s: s.quantile(0.95),
+                    Total='count',
+                )
                 
                 st.write("---")
                 col_in, col_out = st.columns(2)
 
+                def _exibe_metricas_operacao(tipo: str):
+                    """Preenche as métricas de um tipo de operação a partir do agregado único."""
+                    # Bifurcação: o tipo pode não existir no conjunto retornado.
+                    if tipo in perf_stats.index:
+                        linha = perf_stats.loc[tipo]
+                        st.metric("Tempo Médio (ms)", f"{linha['Media']:.2f}")
+                        st.metric("Mediana (ms)", f"{linha['Mediana']:.2f}")
+                        st.metric("P95 (ms)", f"{linha['P95']:.2f}")
+                        st.metric("Total de Transações", f"{int(linha['Total']):,}")
+                    else:
+                        st.info(f"Nenhuma operação '{tipo}' encontrada no período.")
+
                 with col_in:
                     st.subheader("Operações de Entrada (IN)")
-                    if not df_in.empty:
-                        st.metric("Tempo Médio (ms)", f"{df_in['Intervalo_Total_MS'].mean():.2f}")
-                        st.metric("Mediana (ms)", f"{df_in['Intervalo_Total_MS'].median():.2f}")
-                        st.metric("P95 (ms)", f"{df_in['Intervalo_Total_MS'].quantile(0.95):.2f}")
-                        st.metric("Total de Transações", f"{len(df_in):,}")
-                    else:
-                        st.info("Nenhuma operação 'IN' encontrada no período.")
+                    _exibe_metricas_operacao('IN')
 
                 with col_out:
                     st.subheader("Operações de Saída (OUT)")
-                    if not df_out.empty:
-                        st.metric("Tempo Médio (ms)", f"{df_out['Intervalo_Total_MS'].mean():.2f}")
-                        st.metric("Mediana (ms)", f"{df_out['Intervalo_Total_MS'].median():.2f}")
-                        st.metric("P95 (ms)", f"{df_out['Intervalo_Total_MS'].quantile(0.95):.2f}")
-                        st.metric("Total de Transações", f"{len(df_out):,}")
-                    else:
-                        st.info("Nenhuma operação 'OUT' encontrada no período.")
+                    _exibe_metricas_operacao('OUT')
                 
                 with st.expander("Ver dados brutos da análise"):
-                    st.dataframe(df_perf)
+                    # No modo 100k o conjunto pode ter dezenas de milhares de linhas;
+                    # renderiza só as 1000 primeiras e oferece o restante por download.
+                    st.dataframe(df_perf.head(1000))
+                    if len(df_perf) > 1000:
+                        st.caption(f"Exibindo 1.000 de {len(df_perf):,} linhas.")
+                    st.download_button("Baixar CSV completo", _df_to_csv_bytes(df_perf),
+                                       "analise_performance.csv", "text/csv")
             else:
                 st.warning("Não foi possível obter dados para a análise de performance.")
         else:
@@ -889,8 +1321,8 @@ elif app_mode == "Monitoramento de Jobs":
             with st.spinner("Consultando histórico de jobs..."):
                 job_history = repos["job"].get_job_history()
             
-            if job_history:
-                df_jobs = pd.DataFrame(job_history)
+            if not job_history.empty:
+                df_jobs = job_history
                 st.dataframe(df_jobs)
             else:
                 st.info("Nenhum histórico encontrado para o job especificado.")